@@ -2,9 +2,11 @@
 from __future__ import annotations
 
 import asyncio
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 import logging
-import re
+import time
+from types import MappingProxyType
 
 import aiohttp
 import async_timeout
@@ -35,15 +37,37 @@ import homeassistant.helpers.config_validation as cv
 from homeassistant.util.unit_system import METRIC_SYSTEM
 
 import voluptuous as vol
-import xml.etree.ElementTree as ET
+try:
+    from lxml import etree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+# Only advertise brotli when aiohttp can actually decode it.
+try:
+    import brotli  # noqa: F401
+    _ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    _ACCEPT_ENCODING = 'gzip, deflate'
 
 _LOGGER = logging.getLogger("foweather")
 
 CONF_STATIONS = "stations"
 
 MIN_TIME_BETWEEN_UPDATES = timedelta(minutes=5)
+# Fast-path freshness window, kept just under the throttle interval so
+# the 9 sensors sharing one fetcher skip the throttle machinery entirely
+# while the cached data is current.
+DATA_FRESH_SECONDS = 290
 CONF_ATTRIBUTION = "Data provided by the Landverk (lv.fo)"
 
+# Precomputed qualified tag names for the lv.fo spreadsheet XML, so the
+# parser does not resolve namespace prefixes on every find() call.
+_NS = "urn:schemas-microsoft-com:office:spreadsheet"
+_Q_ROW = "{%s}Row" % _NS
+_Q_CELL = "{%s}Cell" % _NS
+_Q_DATA = "{%s}Data" % _NS
+_Q_TYPE = "{%s}Type" % _NS
+
 
 
 class WeatherSensorConfig:
@@ -53,6 +77,10 @@ class WeatherSensorConfig:
     the json data received by WU API.
     """
 
+    __slots__ = ('friendly_name', 'unit_of_measurement', 'feature', 'value',
+                 'entity_picture', 'icon', 'device_state_attributes',
+                 'device_class')
+
     def __init__(self, friendly_name, feature, value,
                  unit_of_measurement=None, entity_picture=None,
                  icon="mdi:gauge", device_state_attributes=None,
@@ -84,6 +112,8 @@ class WeatherSensorConfig:
 class WeatherCurrentConditionsSensorConfig(WeatherSensorConfig):
     """Helper for defining sensor configurations for current conditions."""
 
+    __slots__ = ()
+
     def __init__(self, friendly_name, source, station_id, field , icon="mdi:gauge",
                  unit_of_measurement=None, device_class=None):
         """Constructor.
@@ -111,7 +141,7 @@ class WeatherCurrentConditionsSensorConfig(WeatherSensorConfig):
 
 
 
-SENSOR_TYPES = {
+SENSOR_TYPES = MappingProxyType({
     # current
     'humidity': {
         'name': 'Relative Humidity',
@@ -174,74 +204,66 @@ SENSOR_TYPES = {
         'device_class': ""
     }
     
-}
+})
+
+# Compass points in 22.5 degree steps, starting at north.
+_WIND_DIRECTIONS = ("N", "NNE", "NE", "ENE", "E", "ESE", "SE", "SSE",
+                    "S", "SSW", "SW", "WSW", "W", "WNW", "NW", "NNW")
 
 def wind_direction_to_friendly_name(argument):
     if (argument < 0):
         return ""
-    if 348.75 <= argument or 11.25 > argument:
-        return "N"
-    if 11.25 <= argument < 33.75:
-        return "NNE"
-    if 33.75 <= argument < 56.25:
-        return "NE"
-    if 56.25 <= argument < 78.75:
-        return "ENE"
-    if 78.75 <= argument < 101.25:
-        return "E"
-    if 101.25 <= argument < 123.75:
-        return "ESE"
-    if 123.75 <= argument < 146.25:
-        return "SE"
-    if 146.25 <= argument < 168.75:
-        return "SSE"
-    if 168.75 <= argument < 191.25:
-        return "S"
-    if 191.25 <= argument < 213.75:
-        return "SSW"
-    if 213.75 <= argument < 236.25:
-        return "SW"
-    if 236.25 <= argument < 258.75:
-        return "WSW"
-    if 258.75 <= argument < 281.25:
-        return "W"
-    if 281.25 <= argument < 303.75:
-        return "WNW"
-    if 303.75 <= argument < 326.25:
-        return "NW"
-    if 326.25 <= argument < 348.75:
-        return "NNW"
-    return ""
-
-LV_STATIONS = {
-    'lv_kambsdalur': { 'name': 'Kambsdalur', 'source': 'lv', 'station_id': 'F-10' },
-    'lv_hogareyn': { 'name': 'Høgareyn', 'source': 'lv', 'station_id': 'F-12' },
-    'lv_sund': { 'name': 'Sund', 'source': 'lv', 'station_id': 'F-21' },
-    'lv_runavik': { 'name': 'Runavík', 'source': 'lv', 'station_id': 'F-22' },
-    'lv_vatnsoyrar': { 'name': 'Vatnsoyrar', 'source': 'lv', 'station_id': 'F-23' },
-    'lv_klaksvik': { 'name': 'Klaksvík', 'source': 'lv', 'station_id': 'F-24' },
-    'lv_sandoy': { 'name': 'Sandoy,á Brekkuni Stóru', 'source': 'lv', 'station_id': 'F-25' },
-    'lv_sydradalur': { 'name': 'Syðradalur', 'source': 'lv', 'station_id': 'F-26' },
-    'lv_porkerishalsur': { 'name': 'Porkerishálsur', 'source': 'lv', 'station_id': 'F-27' },
-    'lv_krambatangi': { 'name': 'Krambatangi', 'source': 'lv', 'station_id': 'F-28' },
-    'lv_skopun': { 'name': 'Skopun', 'source': 'lv', 'station_id': 'F-29' },
-    'lv_nordradalsskard': { 'name': 'Norðradalsskarð', 'source': 'lv', 'station_id': 'F-33' },
-    'lv_tjornuvík': { 'name': 'Tjørnuvík', 'source': 'lv', 'station_id': 'F-35' },
-    'lv_nordurisundum': { 'name': 'Norðuri í Sundum, Kollaf', 'source': 'lv', 'station_id': 'F-36' },
-    'lv_nordskalatunnilin': { 'name': 'Norðskálatunnilin', 'source': 'lv', 'station_id': 'F-37' },
-    'lv_kaldbaksbotnur': { 'name': 'Kaldbaksbotnur', 'source': 'lv', 'station_id': 'F-38' },
-    'lv_gotueidi': { 'name': 'Gøtueiði', 'source': 'lv', 'station_id': 'F-39' },
-    'lv_dalavegur': { 'name': 'Dalavegur til Viðareiðis', 'source': 'lv', 'station_id': 'F-40' },
-    'lv_sandavagshalsi': { 'name': 'Á Sandavágshálsi', 'source': 'lv', 'station_id': 'F-41' },
-    'lv_gjaarskard': { 'name': 'Gjáarskarð', 'source': 'lv', 'station_id': 'F-42' },
-    'lv_heltnin': { 'name': 'Heltnin, Oyndarfjarðarvegurin', 'source': 'lv', 'station_id': 'F-43' },
-    'lv_hvalba': { 'name': 'Hvalba', 'source': 'lv', 'station_id': 'F-44' },
-    'lv_streymnes': { 'name': 'Streymnes', 'source': 'lv', 'station_id': 'F-45' },
-    'lv_velbastadhals': { 'name': 'Við Velbastaðháls', 'source': 'lv', 'station_id': 'F-48' },
-    'lv_ordaskard': { 'name': 'Ørðaskarð, Fámjinsvegur', 'source': 'lv', 'station_id': 'F-49' },
-    
-    
-}
+    return _WIND_DIRECTIONS[int((argument + 11.25) // 22.5) % 16]
+
+@dataclass(frozen=True)
+class Station:
+    """Static description of one weather station."""
+
+    name: str
+    source: str
+    station_id: str
+
+
+LV_STATIONS = MappingProxyType({
+    'lv_kambsdalur': Station('Kambsdalur', 'lv', 'F-10'),
+    'lv_hogareyn': Station('Høgareyn', 'lv', 'F-12'),
+    'lv_sund': Station('Sund', 'lv', 'F-21'),
+    'lv_runavik': Station('Runavík', 'lv', 'F-22'),
+    'lv_vatnsoyrar': Station('Vatnsoyrar', 'lv', 'F-23'),
+    'lv_klaksvik': Station('Klaksvík', 'lv', 'F-24'),
+    'lv_sandoy': Station('Sandoy,á Brekkuni Stóru', 'lv', 'F-25'),
+    'lv_sydradalur': Station('Syðradalur', 'lv', 'F-26'),
+    'lv_porkerishalsur': Station('Porkerishálsur', 'lv', 'F-27'),
+    'lv_krambatangi': Station('Krambatangi', 'lv', 'F-28'),
+    'lv_skopun': Station('Skopun', 'lv', 'F-29'),
+    'lv_nordradalsskard': Station('Norðradalsskarð', 'lv', 'F-33'),
+    'lv_tjornuvík': Station('Tjørnuvík', 'lv', 'F-35'),
+    'lv_nordurisundum': Station('Norðuri í Sundum, Kollaf', 'lv', 'F-36'),
+    'lv_nordskalatunnilin': Station('Norðskálatunnilin', 'lv', 'F-37'),
+    'lv_kaldbaksbotnur': Station('Kaldbaksbotnur', 'lv', 'F-38'),
+    'lv_gotueidi': Station('Gøtueiði', 'lv', 'F-39'),
+    'lv_dalavegur': Station('Dalavegur til Viðareiðis', 'lv', 'F-40'),
+    'lv_sandavagshalsi': Station('Á Sandavágshálsi', 'lv', 'F-41'),
+    'lv_gjaarskard': Station('Gjáarskarð', 'lv', 'F-42'),
+    'lv_heltnin': Station('Heltnin, Oyndarfjarðarvegurin', 'lv', 'F-43'),
+    'lv_hvalba': Station('Hvalba', 'lv', 'F-44'),
+    'lv_streymnes': Station('Streymnes', 'lv', 'F-45'),
+    'lv_velbastadhals': Station('Við Velbastaðháls', 'lv', 'F-48'),
+    'lv_ordaskard': Station('Ørðaskarð, Fámjinsvegur', 'lv', 'F-49'),
+})
+
+# (sensor_type, lv.fo data field) pairs created for every lv station.
+_LV_FIELDS = (
+    ('temp', 'temp2'),
+    ('pressure', 'press1'),
+    ('windSpeed', 'mean1'),
+    ('windGust', 'gust2'),
+    ('precipRate', 'rain'),
+    ('precipTotal', 'rainsum'),
+    ('dewpt', 'dew'),
+    ('winddir', 'dir'),
+    ('humidity', 'hum'),
+)
 
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
     vol.Required(CONF_STATIONS): vol.All(cv.ensure_list, vol.Length(min=1), [vol.In(LV_STATIONS)])
@@ -261,23 +283,24 @@ async def async_setup_platform(hass: HomeAssistantType, config: ConfigType,
     stations = config.get(CONF_STATIONS)
     _LOGGER.info("Weatherstations in config: %s", stations )
     print("stations", stations)
-    sensors = []
+    rests = {}
     for station_id in stations:
         station = LV_STATIONS[station_id]
-        _LOGGER.info("Start monitor station: %s", station['name'] )
-        if station['source'] == 'lv':
-            rest = LVWeatherData(hass, station['station_id'])
-            await rest.async_update()
-            unique_id_base = station_id
-            sensors.append(WeatherSensor(hass, rest, 'temp', station['name'], 'lv', station['station_id'],'temp2', unique_id_base))
-            sensors.append(WeatherSensor(hass, rest, 'pressure', station['name'], 'lv', station['station_id'],'press1', unique_id_base))
-            sensors.append(WeatherSensor(hass, rest, 'windSpeed', station['name'], 'lv', station['station_id'],'mean1', unique_id_base))
-            sensors.append(WeatherSensor(hass, rest, 'windGust', station['name'], 'lv', station['station_id'],'gust2', unique_id_base))
-            sensors.append(WeatherSensor(hass, rest, 'precipRate', station['name'], 'lv', station['station_id'],'rain', unique_id_base))
-            sensors.append(WeatherSensor(hass, rest, 'precipTotal', station['name'], 'lv', station['station_id'],'rainsum', unique_id_base))
-            sensors.append(WeatherSensor(hass, rest, 'dewpt', station['name'], 'lv', station['station_id'],'dew', unique_id_base))
-            sensors.append(WeatherSensor(hass, rest, 'winddir', station['name'], 'lv', station['station_id'],'dir', unique_id_base))
-            sensors.append(WeatherSensor(hass, rest, 'humidity', station['name'], 'lv', station['station_id'],'hum', unique_id_base))
+        _LOGGER.info("Start monitor station: %s", station.name )
+        if station.source == 'lv':
+            rests[station_id] = LVWeatherData(hass, station.station_id)
+
+    # Fetch all configured stations concurrently instead of paying one
+    # serial round-trip per station before any entity shows up.
+    await asyncio.gather(*(rest.async_update() for rest in rests.values()))
+
+    sensors = []
+    for station_id, rest in rests.items():
+        station = LV_STATIONS[station_id]
+        sensors.extend(
+            WeatherSensor(hass, rest, sensor_type, station.name, 'lv',
+                          station.station_id, data_field, station_id)
+            for sensor_type, data_field in _LV_FIELDS)
 
     async_add_entities(sensors, True)
 
@@ -286,6 +309,15 @@ async def async_setup_platform(hass: HomeAssistantType, config: ConfigType,
 class WeatherSensor(SensorEntity):
     """Implementing the sensor."""
 
+    # Per-entity attributes live in slots; with 9 sensors per station
+    # this trims the steady-state memory of larger deployments.
+    # entity_id stays on the Entity base, which is not slotted.
+    __slots__ = ('data_field', 'rest', 'station_name', '_sensor_type',
+                 'source', 'station_id', '_state', '_last_seen',
+                 '_state_class', '_attributes', '_icon', '_entity_picture',
+                 '_friendly_name', '_icon_default', '_unit_of_measurement',
+                 '_device_class', '_value_fn', '_date_fn', '_unique_id')
+
     def __init__(self, hass: HomeAssistantType, rest, sensor_type, station_name, source, station_id, data_field, unique_id_base: str):
         """Initialize the sensor."""
         self.data_field = data_field
@@ -295,64 +327,29 @@ class WeatherSensor(SensorEntity):
         self.source = source
         self.station_id = station_id
         self._state = None
+        self._last_seen = 0.0
         self._state_class = "measurement"
         self._attributes = {
             ATTR_ATTRIBUTION: CONF_ATTRIBUTION,
         }
         self._icon = None
         self._entity_picture = None
-        self._unit_of_measurement = self._cfg_expand("unit_of_measurement")
+        sensor_info = SENSOR_TYPES[sensor_type]
+        self._friendly_name = sensor_info['name'] + " (" + station_name + ")"
+        self._icon_default = sensor_info['icon']
+        self._unit_of_measurement = sensor_info['unit_of_measurement']
+        self._device_class = sensor_info['device_class'] or None
+        self._value_fn = lambda: self.rest.data[data_field]
+        self._date_fn = lambda: self.rest.data['time']
         # This is only the suggested entity id, it might get changed by
         # the entity registry later.
         self.entity_id = sensor.ENTITY_ID_FORMAT.format('fo_weather_' + source + '_' + station_id + '_' + sensor_type)
         self._unique_id = "a-{},{},{}".format(source,unique_id_base, sensor_type)
-        self._device_class = self._cfg_expand("device_class")
-
-    def _cfg_expand(self, what, default=None):
-        """Parse and return sensor data."""
-        sensor_info = SENSOR_TYPES[self._sensor_type]
-        cfg = WeatherCurrentConditionsSensorConfig(
-            sensor_info['name'] + " (" + self.station_name + ")",
-            station_id = self.station_id,
-            source = self.source,
-            field= self.data_field,
-            icon = sensor_info['icon'],
-            unit_of_measurement=sensor_info['unit_of_measurement'],
-            device_class= sensor_info['device_class']
-        )
-        #SENSOR_TYPES[self._condition]
-        val = getattr(cfg, what)
-        if not callable(val):
-            return val
-        try:
-            val = val(self.rest)
-        except (KeyError, IndexError, TypeError, ValueError) as err:
-            _LOGGER.warning("Failed to expand cfg from WU API."
-                            " Condition: %s Attr: %s Error: %s",
-                            self._sensor_type, what, repr(err))
-            val = default
-
-        return val
-
-    def _update_attrs(self):
-        """Parse and update device state attributes."""
-        attrs = self._cfg_expand("device_state_attributes", {})
-
-        for (attr, callback) in attrs.items():
-            if callable(callback):
-                try:
-                    self._attributes[attr] = callback(self.rest)
-                except (KeyError, IndexError, TypeError, ValueError) as err:
-                    _LOGGER.warning("Failed to update attrs from WU API."
-                                    " Condition: %s Attr: %s Error: %s",
-                                    self._sensor_type, attr, repr(err))
-            else:
-                self._attributes[attr] = callback
 
     @property
     def name(self):
         """Return the name of the sensor."""
-        return self._cfg_expand("friendly_name")
+        return self._friendly_name
 
     @property
     def state(self):
@@ -390,19 +387,30 @@ class WeatherSensor(SensorEntity):
 
     async def async_update(self):
         """Update current conditions."""
-        await self.rest.async_update()
+        # Only the first sensor of a station hits the shared fetcher per
+        # cycle; the others see fresher data and read the cache directly.
+        if self.rest._last_ok <= self._last_seen:
+            await self.rest.async_update()
 
         if not self.rest.data:
             # no data, return
             return
 
-        self._state = self._cfg_expand("value")
-        self._update_attrs()
-        self._icon = self._cfg_expand("icon", super().icon)
-        url = self._cfg_expand("entity_picture")
-        if isinstance(url, str):
-            self._entity_picture = re.sub(r'^http://', 'https://',
-                                          url, flags=re.IGNORECASE)
+        self._last_seen = self.rest._last_ok
+        try:
+            self._state = self._value_fn()
+        except (KeyError, IndexError, TypeError, ValueError) as err:
+            _LOGGER.warning("Failed to expand cfg from WU API."
+                            " Condition: %s Attr: %s Error: %s",
+                            self._sensor_type, "value", repr(err))
+            self._state = None
+        try:
+            self._attributes['date'] = self._date_fn()
+        except (KeyError, IndexError, TypeError, ValueError) as err:
+            _LOGGER.warning("Failed to update attrs from WU API."
+                            " Condition: %s Attr: %s Error: %s",
+                            self._sensor_type, "date", repr(err))
+        self._icon = self._icon_default
 
     @property
     def unique_id(self) -> str:
@@ -417,59 +425,78 @@ class LVWeatherData:
         self.lv_station = lv_station
         self._features = set()
         self.data = None
+        self._last_ok = 0.0
         self._session = async_get_clientsession(self._hass)
-    
 
-    @Throttle(MIN_TIME_BETWEEN_UPDATES)
     async def async_update(self):
-        """Get the latest data from lv.fo."""
-        headers = {'Accept-Encoding': 'gzip'}
-        ns = {'ss':"urn:schemas-microsoft-com:office:spreadsheet", 'html':"http://www.w3.org/TR/REC-html40"}
+        """Get the latest data from lv.fo, or reuse it while still fresh."""
+        if self.data is not None and \
+                time.monotonic() - self._last_ok < DATA_FRESH_SECONDS:
+            return
+        await self._async_fetch()
+
+    @Throttle(MIN_TIME_BETWEEN_UPDATES)
+    async def _async_fetch(self):
+        """Fetch and parse the latest data from lv.fo."""
+        # Connection: close keeps the early-stopped response (below) from
+        # being handed back to the shared pool half-read, which poisons
+        # the next request on that connection; the server would have
+        # dropped an idle keep-alive connection long before the next
+        # 5-minute refresh anyway.
+        headers = {'Accept-Encoding': _ACCEPT_ENCODING,
+                   'Connection': 'close'}
         lv_url = "https://lv.fo/fr/excel.php"
         current_date = datetime.today()
         url = f"{lv_url}?station={self.lv_station}&year={current_date.year}&month={current_date.month}&day={current_date.day}"
-        weather_data = None
+        row_values = []
         try:
-            with async_timeout.timeout(10):
-                weather_data = await self._session.get(url)
-                if weather_data is None:
-                    raise ValueError('NO CURRENT RESULT')
-                                   
-                
-        except ValueError as err:
-            _LOGGER.error("Check weather API %s", err.args)
+            async with async_timeout.timeout(10):
+                # The shared HA client session keeps the TLS connection to
+                # lv.fo alive between refreshes; async with returns it to
+                # the pool once the body is consumed.
+                async with self._session.get(
+                        url, headers=headers,
+                        raise_for_status=True) as weather_data:
+
+                    # Parse the document incrementally while the body
+                    # streams in, instead of buffering the whole response
+                    # first. Each feed() only parses one chunk, so the
+                    # event loop is never held for a document-sized parse
+                    # burst and no executor offload is needed. Only the
+                    # header row and the newest sample row are used, so
+                    # stop reading as soon as both have been parsed
+                    # rather than downloading the whole day.
+                    parser = ET.XMLPullParser(['end'])
+                    async for chunk in weather_data.content.iter_chunked(16384):
+                        parser.feed(chunk)
+                        for _event, row in parser.read_events():
+                            if row.tag != _Q_ROW or len(row_values) >= 2:
+                                continue
+                            cell_values = []
+                            for cell in row.iterfind(_Q_CELL):
+                                value = cell.find(_Q_DATA)
+                                value_type = value.get(_Q_TYPE)
+                                if value_type == 'String':
+                                    cell_values.append(value.text)
+                                elif value_type == 'Number':
+                                    cell_values.append(float(value.text))
+                            row_values.append(cell_values)
+                            row.clear()
+                        if len(row_values) >= 2:
+                            # Stop the transfer immediately; the rest of
+                            # the day's rows are never used.
+                            weather_data.close()
+                            break
         except (asyncio.TimeoutError, aiohttp.ClientError) as err:
             _LOGGER.error("Error fetching weather data: %s", repr(err))
-        
-        if weather_data:
-        
-            byte_data = bytearray()
-            while not weather_data.content.at_eof():
-                chunk = await weather_data.content.read(1024)
-                byte_data += chunk   
-            root = ET.fromstring(byte_data)
-            work_sheet = root.find("ss:Worksheet", ns)
-            table = work_sheet.find("ss:Table", ns)
-            row_values = []
-            for row in table.findall('ss:Row', ns):
-                cell_values = []
-                for cell in row.findall('ss:Cell', ns):
-                    value = cell.find("ss:Data", ns)
-                    value_type = value.attrib["{urn:schemas-microsoft-com:office:spreadsheet}Type"]
-                    if value_type == 'String':
-                        cell_values.append(value.text)
-                    if value_type == 'Number':
-                        cell_values.append(float(value.text))
-                row_values.append(cell_values)
-
-            idx = 0
-            data = {}
-            name_row = row_values[0]
-            value_row = row_values[1]
-            for cell in name_row:
-                if not cell == 'undef':
-                    data[cell] = value_row[idx]
-                idx += 1
-            
-            self.data = data
-        
\ No newline at end of file
+            return
+
+        if len(row_values) < 2:
+            _LOGGER.error("No weather data rows for station %s",
+                          self.lv_station)
+            return
+
+        self.data = {name: value
+                     for name, value in zip(row_values[0], row_values[1])
+                     if name != 'undef'}
+        self._last_ok = time.monotonic()